@@ -0,0 +1,4 @@
+from .s3_event import FileEventType, S3Event
+from .s3_watcher import S3Watcher
+
+__all__ = ["FileEventType", "S3Event", "S3Watcher"]
@@ -0,0 +1,8 @@
+"""
+Compatibility helpers across supported Python versions.
+"""
+import sys
+
+# `@dataclass(**DATACLASS_SLOTS)` drops the per-instance `__dict__` on Python
+# 3.10+, where `slots=True` is supported, and is a no-op on older versions.
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
@@ -1,19 +1,41 @@
-from dataclasses import dataclass, field
-from typing import List
+from dataclasses import dataclass, field, fields
+from typing import List, Optional
+from .._compat import DATACLASS_SLOTS
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class QueueConfiguration:
     Id: str
     QueueArn: str
-    Events:  List[str] = field(default_factory=lambda _: [
+    Events:  List[str] = field(default_factory=lambda: [
         "s3:ObjectCreated:*",
         "s3:ObjectRemoved:*",
         "s3:ObjectRestore:*"
     ])
+    # e.g. {"Key": {"FilterRules": [{"Name": "prefix", "Value": "folder1/"}]}}
+    Filter: Optional[dict] = None
 
+    @classmethod
+    def for_prefix(cls, Id: str, QueueArn: str, prefix: str = None, **kwargs):
+        """
+        Only deliver notifications for keys under `prefix`, so that S3 drops
+        unrelated events before they ever reach the queue.
+        """
+        if prefix:
+            kwargs["Filter"] = {
+                "Key": {"FilterRules": [{"Name": "prefix", "Value": prefix}]}
+            }
+        return cls(Id=Id, QueueArn=QueueArn, **kwargs)
+
+    def to_dict(self):
+        values = ((name, getattr(self, name)) for name in _QUEUE_CONFIGURATION_FIELDS)
+        return {name: value for name, value in values if value is not None}
+
+
+_QUEUE_CONFIGURATION_FIELDS = tuple(f.name for f in fields(QueueConfiguration))
 
-@dataclass
+
+@dataclass(**DATACLASS_SLOTS)
 class BucketNotifications:
     """
     {
@@ -31,20 +53,43 @@ class BucketNotifications:
     }
     """
     configs: List[QueueConfiguration]
+    # Whether all bucket events are also sent to Amazon EventBridge.
+    event_bridge: bool = False
+    # Notifications to SNS topics and Lambda functions, owned by other
+    # consumers of the bucket and passed through unchanged.
+    topic_configs: List[dict] = field(default_factory=list)
+    lambda_configs: List[dict] = field(default_factory=list)
+    # Memoized payload of `to_dict`, invalidated by `add`, `delete` and `clear`.
+    _cache: Optional[dict] = field(default=None, init=False, repr=False, compare=False)
 
     def to_dict(self):
-        return {
-            "QueueConfigurations": [
-                c.__dict__ for c in self.configs
-            ]
-        }
+        if self._cache is None:
+            self._cache = {
+                "QueueConfigurations": [
+                    c.to_dict() for c in self.configs
+                ]
+            }
+            if self.topic_configs:
+                self._cache["TopicConfigurations"] = self.topic_configs
+            if self.lambda_configs:
+                self._cache["LambdaFunctionConfigurations"] = self.lambda_configs
+            if self.event_bridge:
+                self._cache["EventBridgeConfiguration"] = {}
+        return self._cache
+
+    def enable_event_bridge(self):
+        self.event_bridge = True
+        self._cache = None
 
     def add(self, queue_configuration: QueueConfiguration):
-        self.config.append(queue_configuration)
+        self.configs.append(queue_configuration)
+        self._cache = None
     
     def delete(self, id: str):
         self.configs = [c for c in self.configs if c.Id != id]
+        self._cache = None
     
     def clear(self):
         self.configs = []
+        self._cache = None
     
\ No newline at end of file
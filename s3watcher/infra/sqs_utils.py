@@ -1,4 +1,8 @@
+import functools
+import hashlib
+import json
 import logging
+from typing import List
 
 import boto3
 from botocore.exceptions import ClientError
@@ -6,55 +10,207 @@ from .queue_configurations import BucketNotifications, QueueConfiguration
 
 
 logger = logging.getLogger(__name__)
-sqs = boto3.resource('sqs')
 
 
+@functools.lru_cache(maxsize=1)
+def _session():
+    return boto3.session.Session()
+
+
+@functools.lru_cache(maxsize=None)
+def _client(service_name: str, region: str = None):
+    """A client shared by all helpers, created once per (service, region)."""
+    return _session().client(service_name, region_name=region)
+
+
+@functools.lru_cache(maxsize=None)
+def _resource(service_name: str, region: str = None):
+    """A resource shared by all helpers, created once per (service, region)."""
+    return _session().resource(service_name, region_name=region)
+
+
+@functools.lru_cache(maxsize=1)
 def get_account_number():
-    session = boto3.Session()
-    credentials = session.get_credentials()
-    credentials = credentials.get_frozen_credentials()
-    access_key = credentials.access_key
-    secret_key = credentials.secret_key
-
-    sts = boto3.client(
-        "sts",
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-    )
-    account_id = sts.get_caller_identity()["Account"]
-    return account_id
+    """
+    The AWS account ID of the current credentials. It does not change for the
+    lifetime of the process, so the STS round trip is made only once.
+    """
+    return _client("sts").get_caller_identity()["Account"]
+
+
+DEFAULT_EVENTS = [
+    "s3:ObjectCreated:*",
+    "s3:ObjectRemoved:*",
+    "s3:ObjectRestore:*",
+]
+
+# Maps S3 notification event types to the EventBridge detail types that
+# correspond to them.
+_EVENTBRIDGE_DETAIL_TYPES = {
+    "s3:ObjectCreated": "Object Created",
+    "s3:ObjectRemoved": "Object Deleted",
+    "s3:ObjectRestore": "Object Restore Completed",
+}
+
+# Flattens an EventBridge S3 event to only the fields S3Watcher reads, for
+# watchers with `message_format="eventbridge"`.
+EVENTBRIDGE_INPUT_TRANSFORMER = {
+    "InputPathsMap": {
+        "bucket": "$.detail.bucket.name",
+        "key": "$.detail.object.key",
+        "size": "$.detail.object.size",
+        "etag": "$.detail.object.etag",
+        "versionId": "$.detail.object.version-id",
+        "sequencer": "$.detail.object.sequencer",
+        "eventName": "$.detail-type",
+    },
+    "InputTemplate": (
+        '{"bucket": "<bucket>", "key": "<key>", "size": "<size>", '
+        '"etag": "<etag>", "versionId": "<versionId>", '
+        '"sequencer": "<sequencer>", "eventName": "<eventName>"}'
+    ),
+}
+
+
+# The SQS access policy that lets the notification source send to the queue.
+# Its variable parts are plain ARNs and service names, which need no JSON
+# escaping, so it is filled in with str.format rather than built as a dict.
+_QUEUE_POLICY_TEMPLATE = (
+    '{{"Version": "2012-10-17", '
+    '"Id": "{queue_arn}/SQSDefaultPolicy", '
+    '"Statement": [{{'
+    '"Sid": "allow bucket to notify", '
+    '"Effect": "Allow", '
+    '"Principal": {{"Service": "{principal}"}}, '
+    '"Action": "SQS:*", '
+    '"Resource": "{queue_arn}", '
+    '"Condition": {{"ArnLike": {{"aws:SourceArn": "{source_arn}"}}}}'
+    '}}]}}'
+)
 
 
 def get_current_bucket_notifications(bucket_name: str) -> BucketNotifications:
-    pass
+    client = _client("s3")
+    response = client.get_bucket_notification_configuration(Bucket=bucket_name)
+    return BucketNotifications(
+        configs=[
+            QueueConfiguration(**c) for c in response.get("QueueConfigurations", [])
+        ],
+        event_bridge="EventBridgeConfiguration" in response,
+        topic_configs=response.get("TopicConfigurations", []),
+        lambda_configs=response.get("LambdaFunctionConfigurations", []),
+    )
 
 
-def configure_s3_sqs_for_notification(bucket_name: str, queue_name: str, region: str="us-east-1"):
+# The longest name EventBridge accepts for a rule.
+MAX_RULE_NAME_LENGTH = 64
+
+
+def _eventbridge_rule_name(bucket_name: str) -> str:
+    """
+    The name of the rule of the bucket. Bucket names of up to 63 characters
+    would make it too long, so those are truncated and suffixed with a hash
+    of the full name to stay unique.
+    """
+    rule_name = f"s3watcher-{bucket_name}"
+    if len(rule_name) <= MAX_RULE_NAME_LENGTH:
+        return rule_name
+    digest = hashlib.sha1(bucket_name.encode()).hexdigest()[:8]
+    return f"{rule_name[:MAX_RULE_NAME_LENGTH - 9]}-{digest}"
+
+
+def put_eventbridge_rule(
+    bucket_name: str,
+    queue_arn: str,
+    region: str = "us-east-1",
+    prefix: str = None,
+    events: List[str] = None,
+) -> str:
+    """
+    Route the bucket's EventBridge events to the queue, flattened by
+    EVENTBRIDGE_INPUT_TRANSFORMER.
+
+    :return: The ARN of the rule.
+    """
+    detail_types = {
+        _EVENTBRIDGE_DETAIL_TYPES[e.rsplit(":", 1)[0]] for e in events or DEFAULT_EVENTS
+    }
+    detail = {"bucket": {"name": [bucket_name]}}
+    if prefix:
+        detail["object"] = {"key": [{"prefix": prefix}]}
+    event_pattern = {
+        "source": ["aws.s3"],
+        "detail-type": sorted(detail_types),
+        "detail": detail,
+    }
+    rule_name = _eventbridge_rule_name(bucket_name)
+    client = _client("events", region)
+    rule_arn = client.put_rule(Name=rule_name, EventPattern=json.dumps(event_pattern))[
+        "RuleArn"
+    ]
+    client.put_targets(
+        Rule=rule_name,
+        Targets=[
+            {
+                "Id": "s3watcher",
+                "Arn": queue_arn,
+                "InputTransformer": EVENTBRIDGE_INPUT_TRANSFORMER,
+            }
+        ],
+    )
+    return rule_arn
+
+
+def configure_s3_sqs_for_notification(
+    bucket_name: str,
+    queue_name: str,
+    region: str = "us-east-1",
+    prefix: str = None,
+    events: List[str] = None,
+    via_eventbridge: bool = False,
+):
+    """
+    Subscribe the queue to notifications from the bucket.
+
+    :param prefix: Only notify for keys under this prefix. Filtering is done
+                   by S3, so unrelated records never reach the queue.
+    :param events: The S3 event types to subscribe to. Keep this as narrow as
+                   the consumer needs. Defaults to DEFAULT_EVENTS.
+    :param via_eventbridge: Deliver events through an EventBridge rule that
+                            sends one flat, pre-filtered message per event
+                            instead of S3 notification records.
+    """
     settings = {
         "bucket_name": bucket_name,
         "queue_name": queue_name,
         "region": region,
         "account_number": get_account_number(),
     }
-    s3 = boto3.resource("s3", region_name=region)
-    b = s3.Bucket(bucket_name)
-    client = boto3.client("s3")
+    client = _client("s3")
     bucket_notification_id = f"{bucket_name}"
     queue_arn = "arn:aws:sqs:{region}:{account_number}:{queue_name}".format(
         **settings
     )
+    settings["queue_arn"] = queue_arn
     bucket_notifications = get_current_bucket_notifications(bucket_name)
-    bucket_notifications.add(
-        QueueConfiguration(
-            Id=bucket_notification_id,
-            QueueArn=queue_arn,
-            Events=[
-                "s3:ObjectCreated:*",
-                "s3:ObjectRemoved:*",
-                "s3:ObjectRestore:*",
-            ],
+    bucket_notifications.delete(bucket_notification_id)
+    if via_eventbridge:
+        bucket_notifications.enable_event_bridge()
+        settings["principal"] = "events.amazonaws.com"
+        settings["source_arn"] = put_eventbridge_rule(
+            bucket_name, queue_arn, region=region, prefix=prefix, events=events
         )
-    )
+    else:
+        bucket_notifications.add(
+            QueueConfiguration.for_prefix(
+                Id=bucket_notification_id,
+                QueueArn=queue_arn,
+                prefix=prefix,
+                Events=list(events or DEFAULT_EVENTS),
+            )
+        )
+        settings["principal"] = "s3.amazonaws.com"
+        settings["source_arn"] = "arn:aws:s3:*:*:{bucket_name}".format(**settings)
     bucket_notifications_configuration = bucket_notifications.to_dict()
     # bucket_notifications_configuration = {
     #     "QueueConfigurations": [
@@ -71,36 +227,13 @@ def configure_s3_sqs_for_notification(bucket_name: str, queue_name: str, region:
     #         }
     #     ]
     # }
-    qpolicy = {
-        "Version": "2012-10-17",
-        "Id": "arn:aws:sqs:{region}:{account_number}:{queue_name}/SQSDefaultPolicy".format(
-            **settings
-        ),
-        "Statement": [
-            {
-                "Sid": "allow bucket to notify",
-                "Effect": "Allow",
-                "Principal": {"Service": "s3.amazonaws.com"},
-                "Action": "SQS:*",
-                "Resource": "arn:aws:sqs:{region}:{account_number}:{queue_name}".format(
-                    **settings
-                ),
-                "Condition": {
-                    "ArnLike": {
-                        "aws:SourceArn": "arn:aws:s3:*:*:{bucket_name}".format(
-                            **settings
-                        )
-                    }
-                },
-            }
-        ],
-    }
-    print("Bucket notify", bucket_notifications_configuration)
-    print("Queue Policy", qpolicy)
+    qpolicy = _QUEUE_POLICY_TEMPLATE.format(**settings)
+    logger.debug("Bucket notify: %s", bucket_notifications_configuration)
+    logger.debug("Queue Policy: %s", qpolicy)
     queue_attrs = {
-        "Policy": json.dumps(qpolicy),
+        "Policy": qpolicy,
     }
-    q = boto3.resource("sqs", region_name=region).get_queue_by_name(
+    q = _resource("sqs", region).get_queue_by_name(
         QueueName=settings["queue_name"]
     )
     q.set_attributes(Attributes=queue_attrs)
@@ -108,16 +241,51 @@ def configure_s3_sqs_for_notification(bucket_name: str, queue_name: str, region:
         Bucket=settings["bucket_name"],
         NotificationConfiguration=bucket_notifications_configuration,
     )
-    print("Configuration done")
+    logger.info("Configured notifications from bucket %s to queue %s", bucket_name, queue_name)
+
+
+def remove_s3_sqs_notification(
+    bucket_name: str,
+    queue_name: str,
+    region: str = "us-east-1",
+    via_eventbridge: bool = False,
+):
+    """
+    Undo `configure_s3_sqs_for_notification`, so that nothing keeps pointing
+    at the queue once it is deleted. The queue configuration is removed only
+    if it still targets `queue_name`; other notifications of the bucket, and
+    its EventBridge setting, are left as they are.
+    """
+    if via_eventbridge:
+        client = _client("events", region)
+        rule_name = _eventbridge_rule_name(bucket_name)
+        client.remove_targets(Rule=rule_name, Ids=["s3watcher"])
+        client.delete_rule(Name=rule_name)
+        logger.info("Deleted EventBridge rule %s", rule_name)
+        return
+    bucket_notifications = get_current_bucket_notifications(bucket_name)
+    configs = bucket_notifications.configs
+    if not any(
+        c.Id == bucket_name and c.QueueArn.rsplit(":", 1)[-1] == queue_name
+        for c in configs
+    ):
+        return
+    bucket_notifications.delete(bucket_name)
+    _client("s3").put_bucket_notification_configuration(
+        Bucket=bucket_name,
+        NotificationConfiguration=bucket_notifications.to_dict(),
+    )
+    logger.info("Removed notifications from bucket %s to queue %s", bucket_name, queue_name)
 
 
-def create_queue(name, attributes=None):
+def create_queue(name, attributes=None, region=None):
     """
     Creates an Amazon SQS queue.
 
     :param name: The name of the queue. This is part of the URL assigned to the queue.
     :param attributes: The attributes of the queue, such as maximum message size or
                        whether it's a FIFO queue.
+    :param region: The region of the queue. Defaults to the session's region.
     :return: A Queue object that contains metadata about the queue and that can be used
              to perform queue operations like sending and receiving messages.
     """
@@ -125,12 +293,11 @@ def create_queue(name, attributes=None):
         attributes = {}
 
     try:
-        queue = sqs.create_queue(
+        queue = _resource("sqs", region).create_queue(
             QueueName=name,
             Attributes=attributes
         )
         logger.info("Created queue '%s' with URL=%s", name, queue.url)
-        print("Created queue {0} with URL={1}".format(name, queue.url))
     except ClientError as error:
         logger.exception("Couldn't create queue named '%s'.", name)
         raise error
@@ -146,7 +313,7 @@ def get_queue(name):
     :return: A Queue object.
     """
     try:
-        queue = sqs.get_queue_by_name(QueueName=name)
+        queue = _resource("sqs").get_queue_by_name(QueueName=name)
         logger.info("Got queue '%s' with URL=%s", name, queue.url)
     except ClientError as error:
         logger.exception("Couldn't get queue named %s.", name)
@@ -163,6 +330,7 @@ def get_queues(prefix=None):
     :param prefix: The prefix used to restrict the list of returned queues.
     :return: A list of Queue objects.
     """
+    sqs = _resource("sqs")
     if prefix:
         queue_iter = sqs.queues.filter(QueueNamePrefix=prefix)
     else:
@@ -1,11 +1,47 @@
 """
 Utilities in describing S3 events.
 """
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 import enum
-from dataclasses import dataclass
+import functools
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional
-import boto3
+from ._compat import DATACLASS_SLOTS
+
+
+MAX_POOL_CONNECTIONS = 64
+# Objects at least this large are downloaded as concurrent ranged GETs.
+MULTIPART_THRESHOLD = 16 << 20
+MULTIPART_CHUNKSIZE = 8 << 20
+MAX_RANGE_REQUESTS = 8
+
+
+@functools.lru_cache(maxsize=1)
+def get_client_config():
+    """The botocore config shared by the clients of the watcher."""
+    # Imported here so that importing s3watcher does not load botocore.
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        retries={"mode": "adaptive"},
+        # Keeps pooled connections alive through the gaps between events, so
+        # they are not silently dropped and re-handshaked.
+        tcp_keepalive=True,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_s3_client():
+    """
+    A process-wide S3 client. boto3 clients are thread-safe, so sharing one
+    lets successive downloads reuse its pooled keep-alive connections instead
+    of rebuilding the client and redoing TCP/TLS handshakes per object.
+    """
+    import boto3
+
+    return boto3.client("s3", config=get_client_config())
 
 
 class FileEventType(enum.Enum):
@@ -18,10 +54,12 @@ class FileEventType(enum.Enum):
     DELETED = "deleted"
 
 
-@dataclass
+@dataclass(**DATACLASS_SLOTS)
 class S3Event:
     """
     A dataclass representing an S3 event.
+
+    S3Watcher constructs these positionally; keep the field order stable.
     """
 
     bucket: str
@@ -31,15 +69,93 @@ class S3Event:
     version_id: str
     file_event_type: FileEventType
     sequence: int = None
-    event_datetime: datetime = datetime.now()
+    event_datetime: datetime = field(default_factory=datetime.now)
     event_name: Optional[str] = None
+    # A download started ahead of time by `prefetch`.
+    _prefetched: Optional[Future] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
-    def bytes(self) -> Optional[bytes]:
+    def bytes(self, stream: bool = False):
         """
         The binary content of the object.
+
+        With `stream=True` the unread botocore `StreamingBody` is returned
+        instead, so callers can consume large objects without buffering them.
+
+        Objects of at least MULTIPART_THRESHOLD bytes are returned as the
+        `bytearray` they were downloaded into, rather than as `bytes`.
         """
-        if self.file_event_type == FileEventType.DELETED:
+        if self.file_event_type is FileEventType.DELETED:
             return None
-        s3 = boto3.client("s3")
-        response = s3.get_object(Bucket=self.bucket, Key=self.key)
+        if self._prefetched is not None and not stream:
+            return self._prefetched.result()
+        return self._download(stream)
+
+    def prefetch(self, executor: Executor) -> Future:
+        """
+        Start downloading the content on `executor`, so that a later call to
+        `bytes()` returns it without waiting for a round trip.
+        """
+        self._prefetched = executor.submit(self._download)
+        return self._prefetched
+
+    def _download(self, stream: bool = False):
+        if not stream and self.size is not None and self.size >= MULTIPART_THRESHOLD:
+            return self._ranged_bytes()
+        response = get_s3_client().get_object(
+            Bucket=self.bucket, Key=self.key, **self._version_kwargs()
+        )
+        if stream:
+            return response["Body"]
         return response["Body"].read()
+
+    def _version_kwargs(self) -> dict:
+        # Pinning the version keeps all ranges of one download consistent.
+        return {"VersionId": self.version_id} if self.version_id else {}
+
+    def _ranged_bytes(self) -> bytearray:
+        """
+        Download a large object as concurrent byte-range GETs, each on its own
+        pooled connection, reassembled into one preallocated buffer.
+
+        All ranges must come from the same object: they are pinned to the
+        version, or else to the ETag with IfMatch, and a range of the wrong
+        length, as from an object that no longer has the expected size,
+        raises ValueError.
+        """
+        s3 = get_s3_client()
+        size = self.size
+        buf = bytearray(size)
+        view = memoryview(buf)
+        extra = self._version_kwargs()
+        if not extra and self.etag:
+            etag = self.etag
+            extra = {"IfMatch": etag if etag.startswith('"') else f'"{etag}"'}
+
+        def fetch(lo):
+            hi = min(lo + MULTIPART_CHUNKSIZE, size) - 1
+            response = s3.get_object(
+                Bucket=self.bucket, Key=self.key, Range=f"bytes={lo}-{hi}", **extra
+            )
+            data = response["Body"].read()
+            content_range = response.get("ContentRange", "")
+            total = content_range.rpartition("/")[2]
+            if len(data) != hi + 1 - lo or (total.isdigit() and int(total) != size):
+                raise ValueError(
+                    f"Expected bytes {lo}-{hi} of {size} from "
+                    f"s3://{self.bucket}/{self.key}, got {len(data)} bytes "
+                    f"({content_range or 'no content range'})"
+                )
+            view[lo : hi + 1] = data
+
+        ranges = range(0, size, MULTIPART_CHUNKSIZE)
+        with ThreadPoolExecutor(
+            max_workers=min(len(ranges), MAX_RANGE_REQUESTS)
+        ) as executor:
+            # Consume the iterator so that errors from any range propagate.
+            list(executor.map(fetch, ranges))
+        view.release()
+        # Returned without copying it to bytes, which would double the peak
+        # memory of the download.
+        return buf
@@ -0,0 +1,51 @@
+"""
+Typed schema of the S3 event notification fields that S3Watcher reads.
+
+Decoding against it with msgspec skips every other field of the notification
+(request parameters, user identity, ...) without allocating it. Importing
+this module requires msgspec.
+"""
+from typing import List, Optional, TypedDict
+import msgspec
+
+
+# Fields other than the key may be absent or null depending on the event type
+# and on whether the bucket is versioned.
+class S3Object(TypedDict, total=False):
+    key: str
+    size: Optional[int]
+    eTag: Optional[str]
+    versionId: Optional[str]
+    sequencer: Optional[str]
+
+
+class S3Bucket(TypedDict):
+    name: str
+
+
+class S3Entity(TypedDict):
+    bucket: S3Bucket
+    object: S3Object
+
+
+class S3Record(TypedDict, total=False):
+    eventSource: str
+    eventVersion: str
+    eventName: str
+    eventTime: str
+    s3: S3Entity
+
+
+class S3Notification(TypedDict, total=False):
+    Records: List[S3Record]
+
+
+_DECODER = msgspec.json.Decoder(S3Notification)
+
+
+def decode_records(body) -> List[S3Record]:
+    """
+    The records of a raw S3 notification message body, as plain dicts holding
+    only the fields above.
+    """
+    return _DECODER.decode(body).get("Records", [])
@@ -1,19 +1,62 @@
 """
 Utilities for watching S3 buckets for new file updates.
 """
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
 from dataclasses import dataclass
-import json
+from datetime import datetime
 import logging
+import math
+from queue import Full, Queue
+import threading
 import time
-from typing import Iterable
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
 from urllib.parse import unquote_plus
-import boto3
-from .s3_event import S3Event, FileEventType
-from .infra.sqs_utils import create_queue, configure_s3_sqs_for_notification
+from .s3_event import (
+    MAX_POOL_CONNECTIONS,
+    FileEventType,
+    S3Event,
+    get_client_config,
+)
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    from .s3_records import decode_records as _decode_records
+except ImportError:
+
+    def _decode_records(body):
+        return _json_loads(body).get("Records", [])
 
 
 LOGGER = logging.getLogger(__name__)
 
+# The longest long-polling wait SQS supports.
+MAX_WAIT_SECONDS = 20
+# The most entries a DeleteMessageBatch call accepts.
+MAX_DELETE_BATCH_SIZE = 10
+# Attempts at deleting a message whose deletion failed on the SQS side.
+MAX_DELETE_ATTEMPTS = 3
+# The wait before the first retry of a failed deletion, doubled for each
+# further retry.
+DELETE_RETRY_DELAY_SECONDS = 0.1
+
+# Maps the part of an S3 event name before the colon to the file event type.
+_FILE_EVENT_TYPES = {
+    "ObjectCreated": FileEventType.CREATED,
+    "ObjectRemoved": FileEventType.DELETED,
+    "ObjectRestore": FileEventType.UPDATED,
+}
+# Maps EventBridge detail types to the file event type.
+_EVENTBRIDGE_FILE_EVENT_TYPES = {
+    "Object Created": FileEventType.CREATED,
+    "Object Deleted": FileEventType.DELETED,
+}
+
 
 @dataclass
 class S3Watcher:
@@ -27,15 +70,32 @@ class S3Watcher:
     prefix: str = None
 
     create_sqs_queue: bool = False
+    queue_name: str = None
     queue_url: str = None
     purge_queue_before_watching: bool = False
     delete_sqs_queue_after_done: bool = False
-    wait_seconds: int = 3
+    # SQS long polling wait per receive, clamped to the [1, 20] range SQS
+    # allows. Empty receives return after this long and are retried at once.
+    # It does not extend the visibility timeout: received messages must be
+    # consumed within the queue's visibility timeout or they are redelivered.
+    wait_seconds: int = 20
     max_num_messages_per_fetch: int = 10
+    max_prefetched_batches: int = 1
+    # Once a message arrives, keep receiving for up to
+    # `max_batching_window_seconds` until `batch_size` messages are collected,
+    # and hand them over as one batch. The default of 0 hands over whatever a
+    # single receive returned. Only `watch` batches; `awatch` handles each
+    # receive on its own.
+    batch_size: int = 10
+    max_batching_window_seconds: float = 0
+    # "s3" for S3 notification records, or "eventbridge" for the flat
+    # messages produced by `sqs_utils.EVENTBRIDGE_INPUT_TRANSFORMER`.
+    message_format: str = "s3"
 
     def setup_notification_and_queue(self):
         """
-        TODO: a s3 event notification config looks something like:
+        Create the SQS queue of the watcher and subscribe it to the bucket's
+        notifications. A s3 event notification config looks something like:
 
         {
             "QueueConfigurations": [
@@ -51,74 +111,249 @@ class S3Watcher:
             ]
         }
 
-        Currently we simply overide it. The correct thing to do is to
-        append to the QueueConfigurations.
+        The queue configuration of this watcher replaces any previous one
+        with the same Id; the other queue, topic and lambda configurations of
+        the bucket are kept.
 
         Adding event notification configs does not incur cost.
         """
-        print("Creating AWS SQS Queue : " + sqs_name)
-        try:
-            queue = create_queue(sqs_name)
-            configure_s3_sqs_for_notification(bucket_name, sqs_name)
-        except ClientError as error:
-            print("Couldn't create queue named {0}.".format(sqs_name))
-            raise
+        # boto3 is imported on first use so that importing s3watcher stays cheap.
+        from .infra.sqs_utils import (
+            create_queue,
+            configure_s3_sqs_for_notification,
+        )
 
-        s3_client = boto3.client("s3")
         bucket_name = self.bucket
-        bucket_notification = s3_client.get_bucket_notification(
-            Bucket=bucket_name, ExpectedBucketOwner=get_account_number()
+        sqs_name = self._sqs_queue_name()
+        LOGGER.info("Creating AWS SQS Queue: %s", sqs_name)
+        # create_queue logs its own failures.
+        queue = create_queue(sqs_name, region=self._region())
+        # Let S3 filter by prefix so out-of-scope records are never queued.
+        configure_s3_sqs_for_notification(
+            bucket_name,
+            sqs_name,
+            region=self._region(),
+            prefix=self.prefix,
+            via_eventbridge=self.message_format == "eventbridge",
         )
-        if "QueueConfiguration" in bucket_notification:
-            queueConfig = bucket_notification["QueueConfiguration"]
-            # print(queueConfig)
-            if "Queue" in queueConfig:
-                queue = queueConfig["Queue"]
-                queue_name = queue.split(":")[-1]
-                sqs_client = boto3.client("sqs")
-                queue_url = sqs_client.get_queue_url(
-                    QueueName=queue_name, QueueOwnerAWSAccountId=get_account_number()
-                )
-                self.queue_url = queue_url
-            else:
-                print(f"No queue url in QueueConfiguration. Bucket: {bucket_name}")
-        else:
-            raise ValueError(f"QueueConfiguration not in the bucket notification api response. Bucket: {bucket_name}")
 
-    def watch(self) -> Iterable[S3Event]:
+        # The queue this watcher created, not whichever queue the bucket's
+        # notification happens to name, which may belong to another consumer.
+        self.queue_url = queue.url
+
+    def _check_queue_url(self):
+        if not self.queue_url:
+            raise ValueError(
+                "No queue to watch: pass queue_url, or create_sqs_queue=True "
+                "to create a queue for the bucket"
+            )
+
+    def _region(self) -> str:
+        """The region of the watcher's queue, which must be the bucket's."""
+        return self.sqs_client.meta.region_name
+
+    def _sqs_queue_name(self) -> str:
+        return self.queue_name or "s3watcher-" + self.bucket.replace(".", "-")
+
+    def watch(self, prefetch: bool = False) -> Iterable[S3Event]:
         """
         Start watching the bucket for updates.
+
+        Use the watcher as a context manager so that resources are released,
+        and the queue deleted if `delete_sqs_queue_after_done` is set, once
+        watching stops:
+
+            with S3Watcher(bucket="my-bucket") as watcher:
+                for event in watcher.watch():
+                    ...
+
+        With `prefetch=True`, the content of each created or updated object
+        starts downloading in the background as soon as its batch is taken
+        up, so that `event.bytes()` is usually served from memory.
+
+        Messages are received with SQS long polling: each receive waits up to
+        `wait_seconds` on the server for messages to arrive, so an idle queue
+        costs one request per `wait_seconds` and no client-side sleep is needed.
+
+        A background thread receives and parses the next batch while events
+        are being consumed, and another acknowledges consumed batches, so SQS
+        round trips and decoding overlap with the caller's processing. A batch
+        is deleted only after all of its events have been yielded. Note that
+        the visibility timeout of the up to `max_prefetched_batches` batches
+        received ahead keeps running while the current batch is consumed.
+
+        Once the generator is closed, batches received ahead and not yet
+        consumed are made visible again at once rather than staying hidden
+        for the visibility timeout. A long poll in flight at that moment still
+        runs to completion, for up to `wait_seconds`, before its messages are
+        released too.
         """
         if self.create_sqs_queue:
             self.setup_notification_and_queue()
-        while True:
-            messages = self.queue.receive_messages(
-                MaxNumberOfMessages=self.max_num_messages_per_fetch,
-                WaitTimeSeconds=self.wait_seconds,
-            )
-            num_messages = len(messages)
-            LOGGER.debug(
-                "Received %i message%s", num_messages, "" if num_messages == 1 else "s"
+        self._check_queue_url()
+        batches = Queue(maxsize=self.max_prefetched_batches)
+        acks = Queue()
+        stop = threading.Event()
+        receiver = threading.Thread(
+            target=self._receive_loop, args=(batches, stop), daemon=True
+        )
+        deleter = threading.Thread(target=self._delete_loop, args=(acks,), daemon=True)
+        receiver.start()
+        deleter.start()
+        # Bound once, as this loop runs for every message.
+        next_batch = batches.get
+        ack = acks.put
+        prefetch_event = self._prefetch
+        info = LOGGER.info
+        try:
+            while True:
+                batch = next_batch()
+                if isinstance(batch, Exception):
+                    raise batch
+                if prefetch:
+                    # Start downloading the whole batch before yielding its
+                    # first event, so later events download while earlier
+                    # ones are processed.
+                    for _, events in batch:
+                        for event in events:
+                            prefetch_event(event)
+                for msg, events in batch:
+                    for event in events:
+                        yield event
+                    info("Processed message %s", msg["MessageId"])
+                ack([msg for msg, _ in batch])
+        finally:
+            stop.set()
+            # Flush acknowledgements of the batches that were fully consumed.
+            acks.put(None)
+            deleter.join()
+
+    def _receive_loop(self, batches: Queue, stop: threading.Event):
+        """Long-poll the queue until `stop` is set, handing batches of
+        `(message, events)` pairs to `watch`.
+        """
+        receive_message = self.sqs_client.receive_message
+        queue_url = self.queue_url
+        max_num_messages = self.max_num_messages_per_fetch
+        wait_seconds = self.wait_seconds
+        batch_size = self.batch_size
+        window = self.max_batching_window_seconds
+        parse_message = self._parse_message
+
+        def receive(max_messages: int, wait: int) -> List[dict]:
+            response = receive_message(
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=max_messages,
+                WaitTimeSeconds=wait,
             )
-            if num_messages == 0:
-                time.sleep(self.wait_seconds)
+            return response.get("Messages", [])
 
-            for msg in messages:
-                msg_id = msg.message_id
-                body = json.loads(msg.body)
-                for record in body.get("Records", []):
-                    event = self._create_event(record)
-                    yield event
-                LOGGER.info(f"Processed and deleting message {msg_id}")
-                # TODO: should the message be deleted here?
-                msg.delete()
+        try:
+            while not stop.is_set():
+                messages = receive(max_num_messages, wait_seconds)
+                num_messages = len(messages)
+                LOGGER.debug(
+                    "Received %i message%s", num_messages, "" if num_messages == 1 else "s"
+                )
+                # Long polling already waited up to `wait_seconds` server-side,
+                # so empty receives are simply retried.
+                if not num_messages:
+                    continue
+                deadline = time.monotonic() + window
+                while len(messages) < batch_size and not stop.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    # Rounded up, as a wait of 0 would return at once and
+                    # spin until the window closes.
+                    messages += receive(
+                        min(max_num_messages, batch_size - len(messages)),
+                        min(wait_seconds, max(1, math.ceil(remaining))),
+                    )
+                batch = [(msg, parse_message(msg["Body"])) for msg in messages]
+                if not self._put_until_stopped(batches, batch, stop):
+                    self._release_messages(messages)
+        except Exception as error:  # pylint: disable=broad-except
+            self._put_until_stopped(batches, error, stop)
+        if stop.is_set():
+            # `watch` is closed: hand back the batches it will not consume.
+            while not batches.empty():
+                batch = batches.get_nowait()
+                if not isinstance(batch, Exception):
+                    self._release_messages([msg for msg, _ in batch])
+
+    @staticmethod
+    def _put_until_stopped(q: Queue, item, stop: threading.Event) -> bool:
+        """Put `item` in `q` unless `stop` is set first. Returns whether it was."""
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _release_messages(self, messages: List[dict]):
+        """Make received messages visible again at once, so that they are
+        redelivered without waiting for the visibility timeout.
+        """
+        # ChangeMessageVisibilityBatch takes as many entries as a delete.
+        for start in range(0, len(messages), MAX_DELETE_BATCH_SIZE):
+            entries = [
+                {
+                    "Id": str(i),
+                    "ReceiptHandle": messages[i]["ReceiptHandle"],
+                    "VisibilityTimeout": 0,
+                }
+                for i in range(start, min(start + MAX_DELETE_BATCH_SIZE, len(messages)))
+            ]
+            try:
+                self.sqs_client.change_message_visibility_batch(
+                    QueueUrl=self.queue_url, Entries=entries
+                )
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Failed to release %i messages", len(entries))
+
+    def _delete_loop(self, acks: Queue):
+        """Delete consumed batches until a `None` sentinel is received."""
+        while True:
+            messages = acks.get()
+            if messages is None:
+                return
+            # Any error, including connection errors and timeouts raised by
+            # botocore, is logged and the thread keeps going: a dead deleter
+            # would leave every later message to be redelivered.
+            try:
+                self._delete_messages(messages)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Failed to delete %i messages", len(messages))
+
+    def __post_init__(self):
+        if self.message_format not in ("s3", "eventbridge"):
+            raise ValueError(f"Unknown message format: {self.message_format}")
+        wait_seconds = min(max(self.wait_seconds, 1), MAX_WAIT_SECONDS)
+        if wait_seconds != self.wait_seconds:
+            LOGGER.warning(
+                "wait_seconds must be between 1 and %i, using %i",
+                MAX_WAIT_SECONDS,
+                wait_seconds,
+            )
+            self.wait_seconds = wait_seconds
 
-    def __post_init__(self, bucket, queue_url=None):
+        import boto3
 
         session = boto3.session.Session()
-        self.s3 = session.resource("s3")
-        self.bucket = self.s3.Bucket(bucket)
+        # Sized to stay within the pool of the S3 client shared by downloads,
+        # which is only created by the first download.
+        max_workers = min(self.max_num_messages_per_fetch * 4, MAX_POOL_CONNECTIONS)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Bounds the number of prefetches queued or in flight at once.
+        self._prefetch_slots = threading.BoundedSemaphore(max_workers)
 
+        # The receive and delete hot path uses the low-level client, which
+        # returns plain dicts instead of wrapping each message in a resource.
+        self.sqs_client = session.client("sqs", config=get_client_config())
+        queue_url = self.queue_url
         if queue_url:
             self.sqs = session.resource("sqs")
             self.queue = self.sqs.Queue(queue_url)
@@ -129,18 +364,225 @@ class S3Watcher:
                     self.queue.purge()
                 except self.sqs.meta.client.exceptions.PurgeQueueInProgress:
                     LOGGER.warning(
-                        f"Queue purge already in progress. Queue url: {queue_url}"
+                        "Queue purge already in progress. Queue url: %s", queue_url
                     )
         else:
             self.sqs = None
             self.queue = None
+        # aiobotocore clients, held between `__aenter__` and `__aexit__`.
+        self._async_clients = None
+        self._async_exit_stack = None
+
+    def _prefetch(self, event: S3Event):
+        if event.file_event_type is FileEventType.DELETED:
+            return
+        self._prefetch_slots.acquire()
+        future = event.prefetch(self._executor)
+        future.add_done_callback(lambda _: self._prefetch_slots.release())
+
+    def fetch_batch(self, events: Iterable[S3Event]) -> List[Tuple[S3Event, Optional[bytes]]]:
+        """
+        Download the content of several events concurrently.
+
+        Returns `(event, content)` pairs in the order of `events`. This is
+        safe because `S3Event.bytes()` shares one thread-safe S3 client.
+        """
+        return list(self._executor.map(lambda e: (e, e.bytes()), events))
+
+    async def awatch(self) -> AsyncIterator[S3Event]:
+        """
+        Asynchronous variant of `watch`, built on aiobotocore.
+
+        Receives and deletes run on the event loop, so one thread can keep
+        many SQS and S3 requests in flight. The watcher must be entered with
+        `async with`, which holds its aiobotocore clients. Requires the
+        `async` extra.
+
+        Unlike `watch`, it neither receives ahead nor prefetches, and ignores
+        `batch_size` and `max_batching_window_seconds`: each receive is
+        yielded and then deleted. Use `afetch_batch` to download content
+        concurrently.
+        """
+        sqs = self._async_client("sqs")
+        if self.create_sqs_queue:
+            # Queue and notification setup use blocking boto3 calls.
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.setup_notification_and_queue
+            )
+        self._check_queue_url()
+        while True:
+            response = await sqs.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=self.max_num_messages_per_fetch,
+                WaitTimeSeconds=self.wait_seconds,
+            )
+            messages = response.get("Messages", [])
+            LOGGER.debug("Received %i messages", len(messages))
+            if not messages:
+                continue
+            for msg in messages:
+                for event in self._parse_message(msg["Body"]):
+                    yield event
+            await self._adelete_messages(sqs, messages)
+
+    async def afetch_batch(
+        self, events: Iterable[S3Event]
+    ) -> List[Tuple[S3Event, Optional[bytes]]]:
+        """
+        Asynchronous variant of `fetch_batch`: downloads the content of all
+        events concurrently on the event loop, with the S3 client held by
+        `async with`. Requires the `async` extra.
+        """
+        s3 = self._async_client("s3")
+
+        async def fetch(event):
+            if event.file_event_type is FileEventType.DELETED:
+                return event, None
+            response = await s3.get_object(
+                Bucket=event.bucket, Key=event.key, **event._version_kwargs()
+            )
+            async with response["Body"] as stream:
+                return event, await stream.read()
+
+        return list(await asyncio.gather(*(fetch(e) for e in events)))
+
+    def _async_client(self, service_name: str):
+        if self._async_clients is None:
+            raise RuntimeError(
+                "Enter the watcher with `async with` before using its async methods"
+            )
+        return self._async_clients[service_name]
+
+    async def __aenter__(self):
+        get_session = _import_aiobotocore()
+        from aiobotocore.config import AioConfig
+
+        # aiohttp's default of 10 connections would serialize larger batches.
+        config = AioConfig(max_pool_connections=MAX_POOL_CONNECTIONS)
+        session = get_session()
+        stack = AsyncExitStack()
+        try:
+            self._async_clients = {
+                name: await stack.enter_async_context(
+                    session.create_client(name, config=config)
+                )
+                for name in ("sqs", "s3")
+            }
+        except BaseException:
+            await stack.aclose()
+            raise
+        self._async_exit_stack = stack
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        stack = self._async_exit_stack
+        self._async_clients = self._async_exit_stack = None
+        await stack.aclose()
+        # The queue is deleted with blocking boto3 calls.
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.__exit__, exc_type, exc, tb
+        )
 
-    def __del__(self):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._executor.shutdown(wait=False)
         if self.delete_sqs_queue_after_done:
             self._delete_sqs_queue()
 
     def _delete_sqs_queue(self):
-        raise NotImplementedError
+        if self.create_sqs_queue:
+            # Stop the bucket notifying, or EventBridge forwarding to, the
+            # queue about to be deleted.
+            from botocore.exceptions import ClientError
+            from .infra.sqs_utils import remove_s3_sqs_notification
+
+            try:
+                remove_s3_sqs_notification(
+                    self.bucket,
+                    self._sqs_queue_name(),
+                    region=self._region(),
+                    via_eventbridge=self.message_format == "eventbridge",
+                )
+            except ClientError:
+                LOGGER.exception(
+                    "Failed to remove the notification of bucket %s", self.bucket
+                )
+        if self.queue_url:
+            self.sqs_client.delete_queue(QueueUrl=self.queue_url)
+            LOGGER.info("Deleted queue with URL=%s", self.queue_url)
+
+    def _delete_messages(self, messages):
+        """Delete received messages with one DeleteMessageBatch call per
+        10 messages, the most a single call accepts.
+        """
+        requests = _delete_requests(messages)
+        response = None
+        while True:
+            try:
+                entries, delay = requests.send(response)
+            except StopIteration:
+                return
+            if delay:
+                time.sleep(delay)
+            response = self.sqs_client.delete_message_batch(
+                QueueUrl=self.queue_url, Entries=entries
+            )
+
+    async def _adelete_messages(self, sqs, messages):
+        """Asynchronous variant of `_delete_messages` on an aiobotocore client."""
+        requests = _delete_requests(messages)
+        response = None
+        while True:
+            try:
+                entries, delay = requests.send(response)
+            except StopIteration:
+                return
+            if delay:
+                await asyncio.sleep(delay)
+            response = await sqs.delete_message_batch(
+                QueueUrl=self.queue_url, Entries=entries
+            )
+
+    def _parse_message(self, body: str) -> Iterable[S3Event]:
+        """
+        The events carried by one raw SQS message body. A body that cannot be
+        decoded is logged and carries no events, so that one malformed
+        message does not stop the watch.
+        """
+        try:
+            if self.message_format == "eventbridge":
+                return (self._create_eventbridge_event(_json_loads(body)),)
+            # Messages without records, such as the s3:TestEvent sent when the
+            # notification is configured, are skipped without being decoded.
+            if '"Records"' not in body:
+                return ()
+            events = (self._create_event(r) for r in _decode_records(body))
+            return [event for event in events if event is not None]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            LOGGER.exception("Skipping message that could not be parsed: %.200s", body)
+            return ()
+
+    def _create_eventbridge_event(self, record):
+        """Convert a flat EventBridge message to a S3Event. The rule already
+        filtered by bucket, prefix and event type.
+        """
+        size = record["size"]
+        # Restore events carry no sequencer.
+        sequencer = record["sequencer"]
+        return S3Event(
+            bucket=record["bucket"],
+            key=_decode_key(record["key"]),
+            size=int(size) if size else None,
+            etag=record["etag"] or None,
+            version_id=record["versionId"] or None,
+            sequence=int(sequencer, base=16) if sequencer else None,
+            file_event_type=_EVENTBRIDGE_FILE_EVENT_TYPES.get(
+                record["eventName"], FileEventType.UPDATED
+            ),
+            event_name=record["eventName"],
+        )
 
     # Event information created from SQS S3 records
     def _create_event(self, record):
@@ -155,39 +597,128 @@ class S3Watcher:
             return None
 
         # We require event major version 2. Fail otherwise.
-        event_major_version = record["eventVersion"].split(".")[0]
-        if event_major_version != "2":
+        if not record["eventVersion"].startswith("2."):
             LOGGER.error(
                 "Ignoring unsupported event version %s", record["eventVersion"]
             )
             return None
 
-        bucket = record["s3"]["bucket"]["name"]
+        s3_record = record["s3"]
+        bucket = s3_record["bucket"]["name"]
         if bucket != self.bucket:
             LOGGER.debug("Ignoring record for bucket %s", bucket)
             return None
 
         event_name = record["eventName"]
-        if event_name.startswith("ObjectCreated:"):
-            file_event_type = FileEventType.CREATED
-        elif event_name.startswith("ObjectRemoved:"):
-            file_event_type = FileEventType.DELETED
-        else:
+        file_event_type = _FILE_EVENT_TYPES.get(event_name.partition(":")[0])
+        if file_event_type is None:
             LOGGER.debug("Ignoring non-object event %s", event_name)
             file_event_type = FileEventType.UPDATED
 
+        s3_object = s3_record["object"]
+
         # The object key is URL encoded as for an HTML form
-        key = unquote_plus(record["s3"]["object"]["key"])
+        key = _decode_key(s3_object["key"])
 
-        # The sequencer value is a hex string
-        sequence = int(record["s3"]["object"]["sequencer"], base=16)
+        # The sequencer value is a hex string, sent only for PUT and DELETE
+        # events: restore events have none.
+        sequencer = s3_object.get("sequencer")
+        sequence = int(sequencer, base=16) if sequencer else None
 
+        # Size and eTag are absent from removal events, and versionId from
+        # events of unversioned buckets.
+        # Arguments are positional, in S3Event field order, as this runs for
+        # every record and keyword arguments cost more to bind.
         return S3Event(
-            bucket=self.bucket,
-            key=key,
-            size=record["s3"]["object"]["size"],
-            etag=record["s3"]["object"]["eTag"],
-            version_id=record["s3"]["object"]["versionId"],
-            sequence=sequence,
-            file_event_type=file_event_type,
+            self.bucket,
+            key,
+            s3_object.get("size"),
+            s3_object.get("eTag"),
+            s3_object.get("versionId"),
+            file_event_type,
+            sequence,
+            _parse_event_time(record.get("eventTime")),
+            event_name,
         )
+
+
+def _decode_key(key: str) -> str:
+    """Decode an object key, URL encoded as for an HTML form."""
+    # Most keys contain nothing to decode; skip the decoder for those.
+    if "%" not in key and "+" not in key:
+        return key
+    return unquote_plus(key)
+
+
+def _parse_event_time(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse the eventTime of a record, an ISO 8601 time in UTC such as
+    "2023-01-02T03:04:05.678Z". fromisoformat is much cheaper than strptime;
+    a missing or malformed time gives None rather than failing the watch.
+    """
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        LOGGER.warning("Ignoring malformed event time %r", value)
+        return None
+
+
+def _delete_requests(messages: List[dict]):
+    """
+    The DeleteMessageBatch calls that delete `messages`, shared by the sync
+    and async paths. Yields `(entries, delay)`, the entries of the next call
+    and how long to wait before making it, and is sent the response of each
+    call. Messages are deleted 10 at a time, and entries that failed on the
+    SQS side are retried with an exponential backoff.
+    """
+    message_ids = [msg["MessageId"] for msg in messages]
+    for start in range(0, len(messages), MAX_DELETE_BATCH_SIZE):
+        entries = [
+            {"Id": str(i), "ReceiptHandle": messages[i]["ReceiptHandle"]}
+            for i in range(start, min(start + MAX_DELETE_BATCH_SIZE, len(messages)))
+        ]
+        delay = 0
+        for attempt in range(1, MAX_DELETE_ATTEMPTS + 1):
+            response = yield entries, delay
+            entries = _failed_delete_entries(entries, response, message_ids, attempt)
+            if not entries:
+                break
+            delay = DELETE_RETRY_DELAY_SECONDS * 2 ** (attempt - 1)
+
+
+def _failed_delete_entries(
+    entries: List[dict], response: dict, message_ids: List[str], attempt: int
+) -> List[dict]:
+    """
+    The entries of a DeleteMessageBatch call worth retrying. Failures caused
+    by the request itself (`SenderFault`), or any failure on the last attempt,
+    are logged and dropped; the messages then become visible again after the
+    visibility timeout.
+    """
+    failures = {f["Id"]: f for f in response.get("Failed", [])}
+    retries = []
+    for entry in entries:
+        failure = failures.get(entry["Id"])
+        if failure is None:
+            continue
+        if failure.get("SenderFault") or attempt >= MAX_DELETE_ATTEMPTS:
+            LOGGER.error(
+                "Failed to delete message %s: %s (%s)",
+                message_ids[int(entry["Id"])],
+                failure.get("Message"),
+                failure["Code"],
+            )
+        else:
+            retries.append(entry)
+    return retries
+
+
+def _import_aiobotocore():
+    try:
+        from aiobotocore.session import get_session
+    except ImportError as error:
+        raise ImportError(
+            "aiobotocore is required for async watching. "
+            "Install it with: pip install python-s3watcher[async]"
+        ) from error
+    return get_session
@@ -14,11 +14,12 @@ setup(
     author="Zhangzhang Si",
     author_email="zhangzhang.si@gmail.com",
     license="MIT",
-    packages=["s3watcher"],
+    packages=["s3watcher", "s3watcher.infra"],
     long_description=long_description,
     long_description_content_type="text/markdown",
     python_requires=">=3.6",
     install_requires=install_requires,
+    extras_require={"fast": ["orjson", "msgspec"], "async": ["aiobotocore"]},
     include_package_data=True,
     zip_safe=False,
 )
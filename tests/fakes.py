@@ -0,0 +1,208 @@
+"""Stubs of the AWS clients used by the watcher."""
+import io
+import json
+import threading
+import types
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeSQSClient:
+    """
+    Stands in for the low-level SQS client. Receives return the queued
+    messages, at most `per_call` at a time; an empty receive advances `clock`
+    by its wait, as long polling would. Deletes fail for the receipt handles
+    in `failures`, each mapped to the failure entries returned in turn.
+    """
+
+    def __init__(self, messages=(), per_call=10, clock=None, failures=None):
+        self.messages = list(messages)
+        self.per_call = per_call
+        self.clock = clock
+        self.failures = failures or {}
+        self.receives = []
+        self.delete_calls = []
+        self.deleted = []
+        self.deleted_queues = []
+        self.released = []
+        self.on_empty = None
+        self.meta = types.SimpleNamespace(region_name="us-east-1")
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds):
+        self.receives.append(WaitTimeSeconds)
+        # Fails a receive loop that spins instead of hanging the test run.
+        assert len(self.receives) < 100, "receive loop is spinning"
+        count = min(MaxNumberOfMessages, self.per_call)
+        messages, self.messages = self.messages[:count], self.messages[count:]
+        if not messages:
+            if self.on_empty is not None:
+                self.on_empty()
+            if self.clock is not None:
+                self.clock.now += WaitTimeSeconds
+            return {}
+        return {"Messages": messages}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        assert len(Entries) <= 10
+        self.delete_calls.append(Entries)
+        failed = []
+        for entry in Entries:
+            pending = self.failures.get(entry["ReceiptHandle"])
+            if pending:
+                failed.append(dict(pending.pop(0), Id=entry["Id"]))
+            else:
+                self.deleted.append(entry["ReceiptHandle"])
+        return {"Failed": failed} if failed else {}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        assert len(Entries) <= 10
+        assert all(entry["VisibilityTimeout"] == 0 for entry in Entries)
+        self.released.extend(entry["ReceiptHandle"] for entry in Entries)
+        return {}
+
+    def delete_queue(self, QueueUrl):
+        self.deleted_queues.append(QueueUrl)
+
+
+def s3_record(key, event_name="ObjectCreated:Put", bucket="bucket"):
+    return {
+        "eventVersion": "2.1",
+        "eventSource": "aws:s3",
+        "eventTime": "2023-01-02T03:04:05.678Z",
+        "eventName": event_name,
+        "s3": {
+            "bucket": {"name": bucket},
+            "object": {"key": key, "size": 3, "eTag": "abc", "sequencer": "0A"},
+        },
+    }
+
+
+def sqs_message(i, *records):
+    return {
+        "MessageId": f"id-{i}",
+        "ReceiptHandle": f"handle-{i}",
+        "Body": json.dumps({"Records": list(records)}),
+    }
+
+
+class FakeAWS:
+    """
+    Stands in for the clients and resources of `sqs_utils`. Records the
+    notification configuration put on the bucket and the calls made to
+    EventBridge.
+    """
+
+    def __init__(self, notification=None):
+        self.notification = dict(notification or {})
+        self.queue_attributes = {}
+        self.rules = {}
+        self.targets = {}
+
+    # S3
+    def get_bucket_notification_configuration(self, Bucket):
+        return dict(self.notification, ResponseMetadata={})
+
+    def put_bucket_notification_configuration(self, Bucket, NotificationConfiguration):
+        self.notification = NotificationConfiguration
+
+    # SQS resource
+    def get_queue_by_name(self, QueueName):
+        aws = self
+
+        class Queue:
+            def set_attributes(self, Attributes):
+                aws.queue_attributes[QueueName] = Attributes
+
+        return Queue()
+
+    # EventBridge
+    def put_rule(self, Name, EventPattern):
+        self.rules[Name] = json.loads(EventPattern)
+        return {"RuleArn": f"arn:aws:events:us-east-1:123:rule/{Name}"}
+
+    def put_targets(self, Rule, Targets):
+        self.targets[Rule] = Targets
+
+    def remove_targets(self, Rule, Ids):
+        self.targets[Rule] = [t for t in self.targets[Rule] if t["Id"] not in Ids]
+
+    def delete_rule(self, Name):
+        assert not self.targets.get(Name), "rule still has targets"
+        del self.rules[Name]
+
+
+class FakeS3Client:
+    """Serves GetObject, including byte ranges, from in-memory objects."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        with self.lock:
+            self.calls.append(dict(kwargs, Key=Key, Range=Range))
+        data = self.objects[Key]
+        response = {}
+        if Range:
+            lo, hi = map(int, Range[len("bytes="):].split("-"))
+            response["ContentRange"] = f"bytes {lo}-{hi}/{len(data)}"
+            data = data[lo : hi + 1]
+        response["Body"] = io.BytesIO(data)
+        return response
+
+
+class FakeAioClient:
+    """An aiobotocore client delegating to a synchronous fake."""
+
+    def __init__(self, client):
+        self.client = client
+        self.closed = False
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(**kwargs):
+            response = method(**kwargs)
+            if "Body" in response:
+                response["Body"] = FakeAioStream(response["Body"].read())
+            return response
+
+        return call
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+
+class FakeAioStream:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self):
+        return self.data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class FakeAioSession:
+    def __init__(self, clients):
+        self.clients = clients
+        self.created = []
+
+    def create_client(self, service_name, config=None):
+        client = FakeAioClient(self.clients[service_name])
+        self.created.append(client)
+        return client
@@ -0,0 +1,101 @@
+import asyncio
+import sys
+import threading
+import types
+
+import pytest
+
+from s3watcher import FileEventType, S3Event, S3Watcher
+from .fakes import FakeAioSession, FakeS3Client, FakeSQSClient, s3_record, sqs_message
+
+
+@pytest.fixture
+def aio_session(monkeypatch):
+    """Installs a stub aiobotocore serving the fake SQS and S3 clients."""
+    session = FakeAioSession(
+        {
+            "sqs": FakeSQSClient([sqs_message(i, s3_record(f"k{i}")) for i in range(3)]),
+            "s3": FakeS3Client({"k0": b"0", "k1": b"1"}),
+        }
+    )
+    aiobotocore = types.ModuleType("aiobotocore")
+    aiobotocore.session = types.ModuleType("aiobotocore.session")
+    aiobotocore.session.get_session = lambda: session
+    aiobotocore.config = types.ModuleType("aiobotocore.config")
+    aiobotocore.config.AioConfig = lambda **kwargs: kwargs
+    monkeypatch.setitem(sys.modules, "aiobotocore", aiobotocore)
+    monkeypatch.setitem(sys.modules, "aiobotocore.session", aiobotocore.session)
+    monkeypatch.setitem(sys.modules, "aiobotocore.config", aiobotocore.config)
+    return session
+
+
+def test_async_methods_share_the_watcher_clients(aio_session):
+    watcher = S3Watcher(bucket="bucket", queue_url="queue")
+
+    async def consume():
+        async with watcher:
+            events = []
+            async for event in watcher.awatch():
+                events.append(event)
+                if len(events) == 3:
+                    break
+            deleted = S3Event("bucket", "gone", None, None, None, FileEventType.DELETED)
+            first = await watcher.afetch_batch(events[:2] + [deleted])
+            second = await watcher.afetch_batch(events[:1])
+        return first, second
+
+    first, second = asyncio.run(consume())
+
+    assert [content for _, content in first] == [b"0", b"1", None]
+    assert [content for _, content in second] == [b"0"]
+    assert len(aio_session.created) == 2
+    assert all(client.closed for client in aio_session.created)
+
+
+def test_async_methods_require_async_with(aio_session):
+    watcher = S3Watcher(bucket="bucket", queue_url="queue")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(watcher.afetch_batch([]))
+
+
+def test_awatch_sets_up_the_queue_off_the_event_loop(aio_session, monkeypatch):
+    setup_threads = []
+
+    def setup(self):
+        setup_threads.append(threading.current_thread())
+        self.queue_url = "queue"
+
+    monkeypatch.setattr(S3Watcher, "setup_notification_and_queue", setup)
+    watcher = S3Watcher(bucket="bucket", create_sqs_queue=True)
+
+    async def first_event():
+        async with watcher:
+            async for event in watcher.awatch():
+                return event
+
+    assert asyncio.run(first_event()).key == "k0"
+    assert setup_threads and setup_threads[0] is not threading.main_thread()
+
+
+def test_awatch_deletes_consumed_messages_with_retries(aio_session):
+    sqs = aio_session.clients["sqs"]
+    sqs.failures = {"handle-1": [{"Code": "InternalError", "SenderFault": False}]}
+
+    class Idle(Exception):
+        pass
+
+    def idle():
+        raise Idle()
+
+    sqs.on_empty = idle
+    watcher = S3Watcher(bucket="bucket", queue_url="queue")
+
+    async def consume():
+        async with watcher:
+            return [event.key async for event in watcher.awatch()]
+
+    with pytest.raises(Idle):
+        asyncio.run(consume())
+    assert [len(entries) for entries in sqs.delete_calls] == [3, 1]
+    assert sorted(sqs.deleted) == ["handle-0", "handle-1", "handle-2"]
@@ -0,0 +1,38 @@
+from s3watcher.infra.queue_configurations import (
+    BucketNotifications,
+    QueueConfiguration,
+)
+
+
+def test_to_dict_is_memoized_until_changed():
+    notifications = BucketNotifications(configs=[QueueConfiguration("a", "arn:a")])
+    payload = notifications.to_dict()
+    assert notifications.to_dict() is payload
+
+    notifications.add(QueueConfiguration("b", "arn:b"))
+    assert [c["Id"] for c in notifications.to_dict()["QueueConfigurations"]] == [
+        "a",
+        "b",
+    ]
+
+    notifications.delete("a")
+    assert [c["Id"] for c in notifications.to_dict()["QueueConfigurations"]] == ["b"]
+
+    notifications.enable_event_bridge()
+    assert notifications.to_dict()["EventBridgeConfiguration"] == {}
+
+    notifications.clear()
+    assert notifications.to_dict() == {
+        "QueueConfigurations": [],
+        "EventBridgeConfiguration": {},
+    }
+
+
+def test_queue_configuration_without_prefix_has_no_filter():
+    config = QueueConfiguration.for_prefix("a", "arn:a")
+
+    assert config.to_dict() == {
+        "Id": "a",
+        "QueueArn": "arn:a",
+        "Events": ["s3:ObjectCreated:*", "s3:ObjectRemoved:*", "s3:ObjectRestore:*"],
+    }
@@ -0,0 +1,52 @@
+import pytest
+
+from s3watcher import FileEventType, S3Event
+from s3watcher import s3_event as s3_event_module
+from .fakes import FakeS3Client
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    client = FakeS3Client({})
+    monkeypatch.setattr(s3_event_module, "get_s3_client", lambda: client)
+    monkeypatch.setattr(s3_event_module, "MULTIPART_THRESHOLD", 16)
+    monkeypatch.setattr(s3_event_module, "MULTIPART_CHUNKSIZE", 8)
+    return client
+
+
+def make_event(key, size, etag="abc", version_id=None):
+    return S3Event("bucket", key, size, etag, version_id, FileEventType.CREATED)
+
+
+def test_ranged_download_is_pinned_to_the_etag(s3):
+    s3.objects["big"] = bytes(range(20))
+
+    assert make_event("big", 20).bytes() == bytes(range(20))
+    assert sorted(c["Range"] for c in s3.calls) == [
+        "bytes=0-7",
+        "bytes=16-19",
+        "bytes=8-15",
+    ]
+    assert all(c["IfMatch"] == '"abc"' for c in s3.calls)
+
+
+def test_ranged_download_is_pinned_to_the_version(s3):
+    s3.objects["big"] = bytes(20)
+
+    make_event("big", 20, version_id="v1").bytes()
+    assert all(c["VersionId"] == "v1" and "IfMatch" not in c for c in s3.calls)
+
+
+def test_ranged_download_of_a_resized_object_fails(s3):
+    s3.objects["big"] = bytes(18)
+
+    with pytest.raises(ValueError):
+        make_event("big", 20).bytes()
+
+
+def test_ranged_download_is_not_copied(s3):
+    s3.objects["big"] = bytes(20)
+    s3.objects["small"] = bytes(10)
+
+    assert type(make_event("big", 20).bytes()) is bytearray
+    assert type(make_event("small", 10).bytes()) is bytes
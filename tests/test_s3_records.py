@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from .fakes import s3_record
+
+s3_records = pytest.importorskip("s3watcher.s3_records")
+
+
+def test_msgspec_decoding_matches_json():
+    deleted = s3_record("a%21+b", event_name="ObjectRemoved:Delete")
+    del deleted["s3"]["object"]["size"]
+    del deleted["s3"]["object"]["eTag"]
+    versioned = s3_record("c")
+    versioned["s3"]["object"]["versionId"] = "v1"
+    # Fields the watcher does not read are skipped by msgspec.
+    versioned["userIdentity"] = {"principalId": "someone"}
+    versioned["s3"]["configurationId"] = "bucket"
+    body = json.dumps({"Records": [s3_record("k"), deleted, versioned]})
+
+    decoded = s3_records.decode_records(body)
+    expected = json.loads(body)["Records"]
+
+    for record, full in zip(decoded, expected):
+        assert record["eventName"] == full["eventName"]
+        assert record["eventTime"] == full["eventTime"]
+        assert record["s3"]["bucket"] == full["s3"]["bucket"]
+        assert record["s3"]["object"] == full["s3"]["object"]
+    assert len(decoded) == len(expected)
+    assert "userIdentity" not in decoded[2]
+
+
+def test_watcher_events_match_with_either_decoder(monkeypatch):
+    from s3watcher import S3Watcher
+    from s3watcher import s3_watcher as s3_watcher_module
+
+    body = json.dumps({"Records": [s3_record("k"), s3_record("other", bucket="x")]})
+    watcher = S3Watcher(bucket="bucket", queue_url="queue")
+    with_msgspec = watcher._parse_message(body)
+    monkeypatch.setattr(
+        s3_watcher_module,
+        "_decode_records",
+        lambda body: json.loads(body).get("Records", []),
+    )
+
+    assert watcher._parse_message(body) == with_msgspec
+    assert [event.key for event in with_msgspec] == ["k"]
+
+
+def test_null_object_fields_are_accepted():
+    record = s3_record("k")
+    record["s3"]["object"]["versionId"] = None
+
+    (decoded,) = s3_records.decode_records(json.dumps({"Records": [record]}))
+
+    assert decoded["s3"]["object"]["versionId"] is None
@@ -0,0 +1,322 @@
+import threading
+from queue import Queue
+
+from s3watcher import S3Watcher
+from s3watcher import s3_watcher as s3_watcher_module
+from .fakes import FakeClock, FakeSQSClient, s3_record, sqs_message
+
+
+def make_watcher(sqs_client, **kwargs):
+    watcher = S3Watcher(bucket="bucket", queue_url="queue", **kwargs)
+    watcher.sqs_client = sqs_client
+    return watcher
+
+
+def test_batching_window_waits_at_least_one_second(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(s3_watcher_module, "time", clock)
+    client = FakeSQSClient([sqs_message(0, s3_record("a"))], clock=clock)
+    watcher = make_watcher(client, batch_size=10, max_batching_window_seconds=2.5)
+    batches = Queue(maxsize=1)
+    stop = threading.Event()
+    client.on_empty = lambda: batches.full() and stop.set()
+
+    watcher._receive_loop(batches, stop)
+
+    # The first receive, then one of ceil(2.5) seconds that closes the window.
+    assert client.receives[:2] == [20, 3]
+    # The batch was handed over, then released as nothing consumed it.
+    assert client.released == ["handle-0"]
+
+
+def test_setup_uses_the_created_queue(monkeypatch):
+    from types import SimpleNamespace
+    from s3watcher.infra import sqs_utils
+
+    regions = []
+
+    def create_queue(name, region=None):
+        regions.append(region)
+        return SimpleNamespace(url=f"https://q/{name}")
+
+    def configure(*args, region="us-east-1", **kwargs):
+        regions.append(region)
+
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+    monkeypatch.setattr(sqs_utils, "create_queue", create_queue)
+    monkeypatch.setattr(sqs_utils, "configure_s3_sqs_for_notification", configure)
+    watcher = S3Watcher(bucket="my.bucket")
+
+    watcher.setup_notification_and_queue()
+
+    assert watcher.queue_url == "https://q/s3watcher-my-bucket"
+    assert regions == ["eu-west-1", "eu-west-1"]
+
+
+def test_event_time_parsing_is_tolerant():
+    from datetime import datetime, timezone
+
+    watcher = make_watcher(FakeSQSClient())
+    record = s3_record("a")
+
+    event = watcher._create_event(record)
+    assert event.event_datetime == datetime(
+        2023, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc
+    )
+
+    record["eventTime"] = "2023-01-02T03:04:05Z"
+    event = watcher._create_event(record)
+    assert event.event_datetime == datetime(2023, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+    record["eventTime"] = "yesterday"
+    assert watcher._create_event(record).event_datetime is None
+    del record["eventTime"]
+    assert watcher._create_event(record).event_datetime is None
+
+
+def test_deleting_the_queue_removes_its_notification(monkeypatch):
+    from s3watcher.infra import sqs_utils
+
+    removed = []
+    monkeypatch.setattr(
+        sqs_utils,
+        "remove_s3_sqs_notification",
+        lambda *args, **kwargs: removed.append((args, kwargs)),
+    )
+    client = FakeSQSClient()
+    watcher = make_watcher(
+        client, create_sqs_queue=True, delete_sqs_queue_after_done=True
+    )
+
+    with watcher:
+        pass
+
+    assert removed == [
+        (
+            ("bucket", "s3watcher-bucket"),
+            {"region": "us-east-1", "via_eventbridge": False},
+        )
+    ]
+    assert client.deleted_queues == ["queue"]
+
+
+def test_create_eventbridge_event():
+    from s3watcher import FileEventType
+
+    watcher = make_watcher(FakeSQSClient(), message_format="eventbridge")
+    body = (
+        '{"bucket": "bucket", "key": "a+b%21", "size": "3", "etag": "abc", '
+        '"versionId": "", "sequencer": "0A", "eventName": "Object Created"}'
+    )
+
+    (event,) = watcher._parse_message(body)
+
+    assert (event.bucket, event.key, event.size, event.etag) == ("bucket", "a b!", 3, "abc")
+    assert event.version_id is None
+    assert event.sequence == 10
+    assert event.file_event_type is FileEventType.CREATED
+
+    (event,) = watcher._parse_message(
+        body.replace('"size": "3"', '"size": ""').replace("Object Created", "Object Deleted")
+    )
+    assert event.size is None
+    assert event.file_event_type is FileEventType.DELETED
+
+
+def test_delete_in_chunks_with_retries(monkeypatch):
+    from types import SimpleNamespace
+
+    sleeps = []
+    monkeypatch.setattr(s3_watcher_module, "time", SimpleNamespace(sleep=sleeps.append))
+    transient = {"Code": "InternalError", "SenderFault": False}
+    client = FakeSQSClient(
+        failures={
+            "handle-3": [transient, transient],
+            "handle-5": [{"Code": "ReceiptHandleIsInvalid", "SenderFault": True}],
+            "handle-21": [transient] * 3,
+        }
+    )
+    watcher = make_watcher(client)
+    messages = [sqs_message(i) for i in range(25)]
+
+    watcher._delete_messages(messages)
+
+    assert [len(entries) for entries in client.delete_calls] == [10, 1, 1, 10, 5, 1, 1]
+    assert sorted(client.deleted) == sorted(
+        f"handle-{i}" for i in range(25) if i not in (5, 21)
+    )
+    assert sleeps == [0.1, 0.2, 0.1, 0.2]
+
+
+def idle_sqs_client(messages, **kwargs):
+    """An SQS client whose empty receives wait briefly, like long polling."""
+    import time
+
+    client = FakeSQSClient(messages, **kwargs)
+    client.on_empty = lambda: time.sleep(0.05)
+    return client
+
+
+def wait_for(condition, timeout=5):
+    import time
+
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_watch_receives_and_deletes_in_the_background():
+    messages = [sqs_message(i, s3_record(f"k{i}")) for i in range(20)]
+    # The s3:TestEvent sent when a notification is configured.
+    messages.insert(
+        3,
+        {
+            "MessageId": "test",
+            "ReceiptHandle": "handle-test",
+            "Body": '{"Event": "s3:TestEvent"}',
+        },
+    )
+    client = idle_sqs_client(messages)
+    watcher = make_watcher(client)
+    events = watcher.watch()
+
+    assert next(events).key == "k0"
+    # The receiver fetched the next batch while the first is consumed.
+    wait_for(lambda: len(client.receives) >= 2)
+    keys = ["k0"] + [next(events).key for _ in range(10)]
+    assert keys == [f"k{i}" for i in range(11)]
+    # The deleter acknowledged the first batch while the second is consumed.
+    wait_for(lambda: len(client.deleted) == 10)
+    assert "handle-test" in client.deleted
+    events.close()
+
+
+def test_closing_watch_flushes_consumed_batches():
+    client = idle_sqs_client([sqs_message(i, s3_record(f"k{i}")) for i in range(25)])
+    watcher = make_watcher(client)
+    events = watcher.watch()
+    for _ in range(11):
+        next(events)
+
+    events.close()
+
+    # The first batch was consumed, the second only started.
+    assert sorted(client.deleted) == sorted(f"handle-{i}" for i in range(10))
+
+
+def test_watch_raises_receive_errors():
+    import pytest
+
+    client = FakeSQSClient()
+
+    def fail(**kwargs):
+        raise ConnectionError("unreachable")
+
+    client.receive_message = fail
+    watcher = make_watcher(client)
+
+    with pytest.raises(ConnectionError):
+        next(watcher.watch())
+
+
+def test_watch_prefetches_object_content(monkeypatch):
+    from s3watcher import FileEventType
+    from s3watcher import s3_event as s3_event_module
+    from .fakes import FakeS3Client
+
+    s3 = FakeS3Client({"k0": b"zero", "k1": b"one"})
+    monkeypatch.setattr(s3_event_module, "get_s3_client", lambda: s3)
+    client = idle_sqs_client(
+        [
+            sqs_message(0, s3_record("k0"), s3_record("k1")),
+            sqs_message(1, s3_record("gone", event_name="ObjectRemoved:Delete")),
+        ]
+    )
+    watcher = make_watcher(client)
+    events = watcher.watch(prefetch=True)
+    created = [next(events)]
+    # The next event's content is requested before the first is consumed.
+    wait_for(lambda: "k1" in [call["Key"] for call in list(s3.calls)])
+    created.append(next(events))
+    deleted = next(events)
+    events.close()
+
+    assert all(event._prefetched is not None for event in created)
+    assert [event.bytes() for event in created] == [b"zero", b"one"]
+    assert deleted.file_event_type is FileEventType.DELETED
+    assert deleted._prefetched is None and deleted.bytes() is None
+    # Content was served by the prefetches alone.
+    assert sorted(call["Key"] for call in s3.calls) == ["k0", "k1"]
+    assert watcher.fetch_batch(created) == list(zip(created, [b"zero", b"one"]))
+
+
+def test_restore_record_without_sequencer():
+    from s3watcher import FileEventType
+
+    watcher = make_watcher(FakeSQSClient())
+    record = s3_record("a", event_name="ObjectRestore:Completed")
+    del record["s3"]["object"]["sequencer"]
+
+    event = watcher._create_event(record)
+
+    assert event.sequence is None
+    assert event.file_event_type is FileEventType.UPDATED
+
+
+def test_eventbridge_restore_without_sequencer():
+    from s3watcher import FileEventType
+
+    watcher = make_watcher(FakeSQSClient(), message_format="eventbridge")
+    body = (
+        '{"bucket": "bucket", "key": "a", "size": "3", "etag": "abc", '
+        '"versionId": "", "sequencer": "", "eventName": "Object Restore Completed"}'
+    )
+
+    (event,) = watcher._parse_message(body)
+
+    assert event.sequence is None
+    assert event.file_event_type is FileEventType.UPDATED
+
+
+def test_malformed_messages_are_skipped():
+    client = idle_sqs_client(
+        [
+            sqs_message(0, s3_record("a")),
+            {
+                "MessageId": "bad",
+                "ReceiptHandle": "handle-bad",
+                "Body": '{"Records": [1',
+            },
+            sqs_message(1, {"eventSource": "aws:s3", "eventVersion": "2.1"}),
+            sqs_message(2, s3_record("b")),
+        ]
+    )
+    events = make_watcher(client).watch()
+
+    assert [next(events).key, next(events).key] == ["a", "b"]
+    events.close()
+
+
+def test_closing_watch_releases_batches_received_ahead():
+    client = idle_sqs_client([sqs_message(i, s3_record(f"k{i}")) for i in range(35)])
+    watcher = make_watcher(client)
+    events = watcher.watch()
+    next(events)
+    # One batch waits in the queue, the next is held by the receiver.
+    wait_for(lambda: len(client.receives) >= 3)
+
+    events.close()
+
+    wait_for(lambda: len(client.released) == 20)
+    assert sorted(client.released) == sorted(f"handle-{i}" for i in range(10, 30))
+    assert not client.deleted
+
+
+def test_watch_without_a_queue_fails_clearly():
+    import pytest
+
+    watcher = S3Watcher(bucket="bucket")
+
+    with pytest.raises(ValueError, match="queue_url"):
+        next(watcher.watch())
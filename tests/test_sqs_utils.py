@@ -0,0 +1,147 @@
+import json
+
+import pytest
+
+from s3watcher.infra import sqs_utils
+from .fakes import FakeAWS
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    aws = FakeAWS()
+    monkeypatch.setattr(sqs_utils, "_client", lambda *args: aws)
+    monkeypatch.setattr(sqs_utils, "_resource", lambda *args: aws)
+    monkeypatch.setattr(sqs_utils, "get_account_number", lambda: "123")
+    return aws
+
+
+def test_queue_configuration_filters_by_prefix(aws):
+    sqs_utils.configure_s3_sqs_for_notification(
+        "bucket", "queue", prefix="folder1/", events=["s3:ObjectCreated:*"]
+    )
+
+    assert aws.notification == {
+        "QueueConfigurations": [
+            {
+                "Id": "bucket",
+                "QueueArn": "arn:aws:sqs:us-east-1:123:queue",
+                "Events": ["s3:ObjectCreated:*"],
+                "Filter": {
+                    "Key": {"FilterRules": [{"Name": "prefix", "Value": "folder1/"}]}
+                },
+            }
+        ]
+    }
+
+
+def test_other_notifications_are_kept(aws):
+    other_queue = {
+        "Id": "other",
+        "QueueArn": "arn:aws:sqs:us-east-1:123:other",
+        "Events": ["s3:ObjectCreated:*"],
+    }
+    topic = {"Id": "topic", "TopicArn": "arn:aws:sns:t", "Events": ["s3:ObjectRemoved:*"]}
+    function = {
+        "Id": "lambda",
+        "LambdaFunctionArn": "arn:aws:lambda:f",
+        "Events": ["s3:ObjectCreated:*"],
+    }
+    aws.notification = {
+        "QueueConfigurations": [other_queue, dict(other_queue, Id="bucket")],
+        "TopicConfigurations": [topic],
+        "LambdaFunctionConfigurations": [function],
+    }
+
+    sqs_utils.configure_s3_sqs_for_notification("bucket", "queue")
+
+    assert [c["Id"] for c in aws.notification["QueueConfigurations"]] == [
+        "other",
+        "bucket",
+    ]
+    assert aws.notification["QueueConfigurations"][0] == other_queue
+    assert aws.notification["TopicConfigurations"] == [topic]
+    assert aws.notification["LambdaFunctionConfigurations"] == [function]
+
+
+def test_remove_notification_keeps_the_others(aws):
+    other_queue = {
+        "Id": "other",
+        "QueueArn": "arn:aws:sqs:us-east-1:123:other",
+        "Events": ["s3:ObjectCreated:*"],
+    }
+    aws.notification = {"QueueConfigurations": [other_queue]}
+    sqs_utils.configure_s3_sqs_for_notification("bucket", "queue")
+
+    sqs_utils.remove_s3_sqs_notification("bucket", "queue")
+
+    assert aws.notification == {"QueueConfigurations": [other_queue]}
+
+
+def test_remove_eventbridge_rule(aws):
+    sqs_utils.configure_s3_sqs_for_notification("bucket", "queue", via_eventbridge=True)
+    assert aws.rules
+
+    sqs_utils.remove_s3_sqs_notification("bucket", "queue", via_eventbridge=True)
+
+    assert not aws.rules
+
+
+def test_eventbridge_rule(aws):
+    rule_arn = sqs_utils.put_eventbridge_rule(
+        "bucket", "arn:aws:sqs:us-east-1:123:queue", prefix="folder1/"
+    )
+
+    assert rule_arn == "arn:aws:events:us-east-1:123:rule/s3watcher-bucket"
+    assert aws.rules["s3watcher-bucket"] == {
+        "source": ["aws.s3"],
+        "detail-type": ["Object Created", "Object Deleted", "Object Restore Completed"],
+        "detail": {
+            "bucket": {"name": ["bucket"]},
+            "object": {"key": [{"prefix": "folder1/"}]},
+        },
+    }
+    (target,) = aws.targets["s3watcher-bucket"]
+    assert target["Arn"] == "arn:aws:sqs:us-east-1:123:queue"
+    assert target["InputTransformer"] is sqs_utils.EVENTBRIDGE_INPUT_TRANSFORMER
+
+
+def test_eventbridge_rule_name_fits_long_bucket_names(aws):
+    long_names = ["a" * 63, "a" * 62 + "b"]
+    for name in long_names:
+        sqs_utils.put_eventbridge_rule(name, "arn:aws:sqs:us-east-1:123:queue")
+
+    assert len(aws.rules) == 2
+    assert all(len(rule) <= sqs_utils.MAX_RULE_NAME_LENGTH for rule in aws.rules)
+
+
+@pytest.mark.parametrize(
+    "via_eventbridge, principal, source_arn",
+    [
+        (False, "s3.amazonaws.com", "arn:aws:s3:*:*:bucket"),
+        (
+            True,
+            "events.amazonaws.com",
+            "arn:aws:events:us-east-1:123:rule/s3watcher-bucket",
+        ),
+    ],
+)
+def test_queue_policy(aws, via_eventbridge, principal, source_arn):
+    sqs_utils.configure_s3_sqs_for_notification(
+        "bucket", "queue", via_eventbridge=via_eventbridge
+    )
+
+    policy = json.loads(aws.queue_attributes["queue"]["Policy"])
+    assert policy == {
+        "Version": "2012-10-17",
+        "Id": "arn:aws:sqs:us-east-1:123:queue/SQSDefaultPolicy",
+        "Statement": [
+            {
+                "Sid": "allow bucket to notify",
+                "Effect": "Allow",
+                "Principal": {"Service": principal},
+                "Action": "SQS:*",
+                "Resource": "arn:aws:sqs:us-east-1:123:queue",
+                "Condition": {"ArnLike": {"aws:SourceArn": source_arn}},
+            }
+        ],
+    }